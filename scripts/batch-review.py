@@ -5,30 +5,117 @@ Batch Review для великих змін - оптимізований для
 
 import os
 import sys
+import re
 import json
-import requests
+import codecs
+import asyncio
+import datetime
 import subprocess
 from pathlib import Path
 from typing import List, Dict, Optional
 import argparse
 
+try:
+    from orjson import dumps as json_dumps, loads as json_loads
+except ImportError:
+    # orjson опційний, інакше використовуємо повільніший stdlib json
+    json_loads = json.loads
+
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode('utf-8')
+
+try:
+    import ijson
+except ImportError:
+    # ijson опційний, без нього відповідь парситься повністю
+    ijson = None
+
+# Заголовок секції файлу у виводі `git diff`. Шляхи зі спецсимволами
+# git бере в лапки з C-екрануванням: `diff --git "a/x\"y" "b/x\"y"`,
+# інші йдуть як є: `diff --git a/<шлях> b/<шлях>`
+DIFF_HEADER_RE = re.compile(
+    rb'^diff --git (?:"a/(?:[^"\\]|\\.)*" "b/((?:[^"\\]|\\.)*)"|(a/.*))$',
+    re.MULTILINE
+)
+
+# Рішення review, що блокує push
+REJECT_RE = re.compile(r'ВІДХИЛИТИ|REJECT')
+
+# Скільки символів diff'у батчу потрапляє у prompt
+MAX_PROMPT_DIFF_CHARS = 8000
+
+# Секція вердикту по файлу у відповіді моделі: `### file: <шлях>`
+FILE_SECTION_RE = re.compile(r'^#{2,4}\s*file:\s*(.+?)\s*$', re.MULTILINE | re.IGNORECASE)
+
+# Розширення файлів, що потребують review
+RELEVANT_EXTS = frozenset({'.cs', '.js', '.ts', '.py', '.sql', '.razor', '.json'})
+
+async def read_review_text(response) -> str:
+    """Текст першої відповіді моделі з chat completion"""
+    if ijson is None:
+        result = json_loads(await response.read())
+        return result['choices'][0]['message']['content']
+
+    # Потоково парсимо body і зберігаємо лише content, без повного дерева.
+    # Дочитуємо відповідь до кінця, щоб keep-alive з'єднання повернулось у пул.
+    review_text = None
+    try:
+        async for content in ijson.items(response.content, 'choices.item.message.content'):
+            if review_text is None:
+                review_text = content
+    except ijson.JSONError as e:
+        # Помилки ijson багаторядкові, лишаємо перший рядок
+        message = str(e).partition('\n')[0]
+        raise ValueError(f"Malformed response: {message}") from e
+
+    if review_text is None:
+        raise KeyError('choices')
+    return review_text
+
 class BatchReviewer:
     def __init__(self):
         self.copilot_url = os.getenv('COPILOT_PROXY_URL', 'http://localhost:8080/v1/chat/completions')
         self.config = self._load_config()
+        self.session = None  # aiohttp.ClientSession, created on first request
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self):
+        """Обмеження паралельності, HTTP сесія створюється при першому запиті"""
+        self._semaphore = asyncio.Semaphore(self.config.get('max_concurrency', 4))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _get_session(self):
+        """Спільна HTTP сесія, створюється при першому використанні"""
+        if self.session is None:
+            # Лінивий імпорт: aiohttp не потрібен, якщо review пропущено
+            import aiohttp
+
+            max_concurrency = self.config.get('max_concurrency', 4)
+            # Одне keep-alive з'єднання на кожен паралельний запит, спільне для всіх батчів
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=max_concurrency),
+                headers={'Content-Type': 'application/json'},
+                timeout=aiohttp.ClientTimeout(total=60)
+            )
+        return self.session
 
     def _load_config(self) -> Dict:
         """Завантаження конфігурації"""
         config_file = Path('.copilot-config.json')
         if config_file.exists():
-            with open(config_file) as f:
-                return json.load(f)
+            return json_loads(config_file.read_bytes())
 
         return {
             "model": "gpt-4",
             "temperature": 0.2,
             "max_tokens": 2000,
-            "batch_size": 5
+            "batch_size": 5,
+            "max_concurrency": 4
         }
 
     def get_changed_files(self) -> List[str]:
@@ -36,39 +123,102 @@ class BatchReviewer:
         try:
             # Отримуємо файли що будуть push'нуті
             result = subprocess.run([
-                'git', 'diff', '--name-only', 'HEAD~1', 'HEAD'
-            ], capture_output=True, text=True)
+                'git', 'diff', '--name-only', '--diff-filter=ACMR', 'HEAD~1', 'HEAD'
+            ], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
 
-            if result.returncode == 0:
-                return [f.strip() for f in result.stdout.split('\n') if f.strip()]
-            else:
+            if result.returncode != 0:
                 # Fallback - staged files
                 result = subprocess.run([
-                    'git', 'diff', '--cached', '--name-only'
-                ], capture_output=True, text=True)
-                return [f.strip() for f in result.stdout.split('\n') if f.strip()]
+                    'git', 'diff', '--cached', '--name-only', '--diff-filter=ACMR'
+                ], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+            return [f.strip().decode('utf-8', errors='replace') for f in result.stdout.split(b'\n') if f.strip()]
 
         except Exception as e:
             print(f"Error getting changed files: {e}")
             return []
 
-    def batch_review(self, files: List[str], priority: str = "normal") -> Optional[Dict]:
-        """Батч ревью декількох файлів"""
+    def get_file_diffs(self, files: List[str]) -> Dict[str, bytes]:
+        """Отримання diff'ів всіх файлів одним викликом git (без декодування)"""
         if not files:
-            return None
+            return {}
 
-        # Збираємо всі diff'и
-        combined_diff = ""
+        try:
+            result = subprocess.run(self._diff_command(files), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        except OSError:
+            # Задовгий командний рядок (ліміт CreateProcess на Windows) - diff по одному файлу
+            return self._get_file_diffs_one_by_one(files)
+        except Exception as e:
+            print(f"Error getting diffs: {e}")
+            return {}
+
+        if result.returncode != 0:
+            return {}
+
+        # Розбиваємо вивід на секції по заголовку `diff --git a/... b/...`
+        diffs = {}
+        headers = list(DIFF_HEADER_RE.finditer(result.stdout))
+        for header, next_header in zip(headers, headers[1:] + [None]):
+            end = next_header.start() if next_header else len(result.stdout)
+            path = self._diff_header_path(*header.groups()).decode('utf-8', errors='replace')
+            diffs[path] = result.stdout[header.start():end]
+
+        return diffs
+
+    def _get_file_diffs_one_by_one(self, files: List[str]) -> Dict[str, bytes]:
+        """Отримання diff'ів окремим викликом git для кожного файлу"""
+        diffs = {}
         for filepath in files:
             try:
-                result = subprocess.run([
-                    'git', 'diff', '--cached', '--', filepath
-                ], capture_output=True, text=True)
-
-                if result.returncode == 0 and result.stdout:
-                    combined_diff += f"\n\n### {filepath}\n{result.stdout}"
+                result = subprocess.run(self._diff_command([filepath]),
+                                        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
             except Exception as e:
                 print(f"Error getting diff for {filepath}: {e}")
+                continue
+
+            if result.returncode == 0 and result.stdout:
+                diffs[filepath] = result.stdout
+
+        return diffs
+
+    @staticmethod
+    def _diff_command(files: List[str]) -> List[str]:
+        """Команда git diff з фіксованим форматом виводу незалежно від налаштувань користувача"""
+        # quotePath=false - не-ASCII шляхи (`Сервіс.cs`) виводяться як є;
+        # --no-color, --no-ext-diff і явні префікси перекривають color.diff,
+        # diff.external, diff.noprefix і diff.mnemonicPrefix
+        return [
+            'git', '-c', 'core.quotePath=false', 'diff', '--cached',
+            '--no-color', '--no-ext-diff', '--src-prefix=a/', '--dst-prefix=b/', '--'
+        ] + files
+
+    @staticmethod
+    def _diff_header_path(quoted_path: Optional[bytes], plain_paths: Optional[bytes]) -> bytes:
+        """Шлях файлу (b/...) із заголовка секції `git diff`"""
+        if quoted_path is not None:
+            return codecs.escape_decode(quoted_path)[0]
+
+        # `a/<шлях> b/<шлях>` - шлях може сам містити ` b/`, тому ділимо навпіл
+        size = (len(plain_paths) - len(b'a/ b/')) // 2
+        if plain_paths[2:2 + size] == plain_paths[-size:]:
+            return plain_paths[-size:]
+
+        # Перейменування: шляхи різні
+        return plain_paths.rsplit(b' b/', 1)[-1]
+
+    async def batch_review(self, files: List[str], diffs: Dict[str, bytes], priority: str = "normal",
+                           diff_limit: int = MAX_PROMPT_DIFF_CHARS) -> Optional[Dict]:
+        """Батч ревью декількох файлів"""
+        if not files:
+            return None
+
+        # Збираємо всі diff'и, декодуємо лише те, що потрапить у prompt
+        combined_diff = ""
+        for filepath in files:
+            if diffs.get(filepath):
+                combined_diff += f"\n\n### file: {filepath}\n" + diffs[filepath].decode('utf-8', errors='replace')
+                if len(combined_diff) >= diff_limit:
+                    break
 
         if not combined_diff.strip():
             return None
@@ -83,6 +233,7 @@ class BatchReviewer:
 2. **АРХІТЕКТУРНІ ПРОБЛЕМИ**: Загальні проблеми дизайну
 3. **МІЖФАЙЛОВІ ЗВ'ЯЗКИ**: Консистентність між файлами
 4. **РИЗИКИ**: Потенційні проблеми при деплої
+5. **ВЕРДИКТ ПО ФАЙЛАХ**: Для кожного файлу окрема секція `### file: <шлях>` з рішенням ПРИЙНЯТИ/ВІДХИЛИТИ
 
 Формат: Структурований Markdown з чіткими рекомендаціями."""
 
@@ -91,63 +242,115 @@ class BatchReviewer:
 **Файли**: {', '.join(files)}
 
 ```diff
-{combined_diff[:8000]}
+{combined_diff[:diff_limit]}
 ```
 
 Проаналізуйте як цілісну зміну."""
 
         try:
-            response = requests.post(self.copilot_url,
-                json={
-                    "model": self.config["model"],
-                    "temperature": self.config["temperature"],
-                    "max_tokens": self.config["max_tokens"],
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ]
-                },
-                timeout=60
-            )
-
-            if response.status_code == 200:
-                result = response.json()
-                review_text = result['choices'][0]['message']['content']
-
-                return {
-                    'files': files,
-                    'review': review_text,
-                    'priority': priority,
-                    'total_files': len(files)
-                }
-
+            # Обмежуємо кількість одночасних запитів до проксі
+            async with self._semaphore:
+                async with self._get_session().post(self.copilot_url,
+                    data=json_dumps({
+                        "model": self.config["model"],
+                        "temperature": self.config["temperature"],
+                        "max_tokens": self.config["max_tokens"],
+                        "messages": [
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_prompt}
+                        ]
+                    })
+                ) as response:
+                    if response.status == 200:
+                        review_text = await read_review_text(response)
+
+                        return {
+                            'files': files,
+                            'review': review_text,
+                            'priority': priority,
+                            'total_files': len(files)
+                        }
+
+                    print(f"⚠️  Batch review API returned status {response.status}")
+
+        except ImportError:
+            # Відсутній aiohttp - це не збій API, push не можна пропускати
+            raise
         except Exception as e:
             print(f"⚠️  Batch review API error: {e}")
 
         return None
 
-    def save_batch_review(self, review: Dict):
+    def get_rejected_files(self, review: Dict) -> List[str]:
+        """Файли, відхилені review, за секціями вердиктів по файлах"""
+        text = review['review']
+        files = review['files']
+        if not REJECT_RE.search(text):
+            return []
+
+        sections = list(FILE_SECTION_RE.finditer(text))
+
+        # Без секцій або при загальному ВІДХИЛИТИ блокуємо весь батч
+        if not sections or REJECT_RE.search(text, 0, sections[0].start()):
+            return list(files)
+
+        rejected = []
+        for section, next_section in zip(sections, sections[1:] + [None]):
+            end = next_section.start() if next_section else len(text)
+            # Вердикт може стояти в самому заголовку: `### file: a.cs — ВІДХИЛИТИ`
+            if not REJECT_RE.search(text, section.start(), end):
+                continue
+
+            heading = section.group(1).lstrip('`*')
+            matches = [filepath for filepath in files if heading.startswith(filepath)]
+            if not matches:
+                # Невідомий файл у відповіді - не ризикуємо, блокуємо все
+                return list(files)
+
+            filepath = max(matches, key=len)
+            if filepath not in rejected:
+                rejected.append(filepath)
+
+        # Страховка: ВІДХИЛИТИ є у відповіді, але не прив'язане до жодного файлу
+        return rejected or list(files)
+
+    def save_batch_review(self, review: Dict, batch_number: Optional[int] = None):
         """Збереження batch review"""
         reviews_dir = Path('.pre-commit-reviews')
         reviews_dir.mkdir(exist_ok=True)
 
-        import datetime
-        timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-
-        review_file = reviews_dir / f"batch_review_{timestamp}.md"
-
-        with open(review_file, 'w') as f:
-            f.write("# Batch Code Review (Pre-Push)\n\n")
-            f.write(f"**Timestamp**: {datetime.datetime.now().isoformat()}\n")
-            f.write(f"**Priority**: {review['priority'].upper()}\n")
-            f.write(f"**Files Count**: {review['total_files']}\n\n")
-            f.write(f"**Files**:\n")
-            for file in review['files']:
-                f.write(f"- {file}\n")
-            f.write("\n")
-            f.write("## Review Results\n\n")
-            f.write(review['review'])
-            f.write("\n")
+        now = datetime.datetime.now()
+
+        # Паралельні батчі завершуються в ту саму секунду - додаємо номер
+        suffix = f"_{batch_number}" if batch_number is not None else ""
+        review_file = reviews_dir / f"batch_review_{now.strftime('%Y%m%d_%H%M%S')}{suffix}.md"
+
+        # Формуємо весь звіт і записуємо одним викликом
+        parts = [
+            "# Batch Code Review (Pre-Push)\n\n",
+            f"**Timestamp**: {now.isoformat()}\n",
+            f"**Priority**: {review['priority'].upper()}\n",
+            f"**Files Count**: {review['total_files']}\n\n",
+            "**Files**:\n",
+        ]
+        parts.extend(f"- {file}\n" for file in review['files'])
+        parts.extend([
+            "\n",
+            "## Review Results\n\n",
+            review['review'],
+            "\n",
+        ])
+
+        review_file.write_text(''.join(parts), encoding='utf-8')
+
+async def review_batches(reviewer: BatchReviewer, batches: List[List[str]],
+                         diffs: Dict[str, bytes], priority: str, diff_limit: int) -> List:
+    """Паралельний review всіх батчів"""
+    async with reviewer:
+        return await asyncio.gather(
+            *(reviewer.batch_review(batch_files, diffs, priority, diff_limit) for batch_files in batches),
+            return_exceptions=True
+        )
 
 def main():
     parser = argparse.ArgumentParser(description='Batch Code Review for Pre-Push')
@@ -165,8 +368,7 @@ def main():
     files = args.files if args.files else reviewer.get_changed_files()
 
     # Фільтруємо тільки потрібні розширення
-    relevant_extensions = ['.cs', '.js', '.ts', '.py', '.sql', '.razor', '.json']
-    files = [f for f in files if any(f.endswith(ext) for ext in relevant_extensions)]
+    files = [f for f in files if os.path.splitext(f)[1] in RELEVANT_EXTS]
 
     if len(files) < args.threshold:
         print(f"[SKIP] Only {len(files)} files changed (threshold: {args.threshold}) - SKIPPED")
@@ -174,26 +376,55 @@ def main():
 
     print(f"[BATCH] Running batch review on {len(files)} files (priority: {args.priority})...")
 
-    # Розбиваємо на батчі якщо забагато файлів
-    batch_size = reviewer.config.get('batch_size', 5)
+    diffs = reviewer.get_file_diffs(files)
+
+    # Весь diff вміщується в контекст моделі - один запит замість батчів.
+    # Розмір контексту залежить від моделі, тому без явного налаштування
+    # працюємо батчами, як і раніше
+    max_context_chars = reviewer.config.get('max_context_chars')
+    # Байти diff'а - верхня межа кількості символів після декодування;
+    # заголовок `### file:` кожного файлу теж займає місце в prompt
+    prompt_chars = sum(len(f"\n\n### file: {filepath}\n") + len(diffs[filepath])
+                       for filepath in files if diffs.get(filepath))
+    if max_context_chars and prompt_chars <= max_context_chars:
+        batches = [files]
+        diff_limit = max_context_chars
+    else:
+        # Розбиваємо на батчі якщо забагато файлів
+        batch_size = reviewer.config.get('batch_size', 5)
+        batches = [files[i:i+batch_size] for i in range(0, len(files), batch_size)]
+        diff_limit = MAX_PROMPT_DIFF_CHARS
     failed_reviews = []
 
-    for i in range(0, len(files), batch_size):
-        batch_files = files[i:i+batch_size]
-        print(f"[BATCH] Reviewing batch {i//batch_size + 1}: {len(batch_files)} files...")
+    for number, batch_files in enumerate(batches, 1):
+        print(f"[BATCH] Reviewing batch {number}: {len(batch_files)} files...")
+
+    results = asyncio.run(review_batches(reviewer, batches, diffs, args.priority, diff_limit))
+
+    # Без HTTP клієнта review не відбувся - блокуємо push явно
+    import_errors = [result for result in results if isinstance(result, ImportError)]
+    if import_errors:
+        print(f"[ERROR] Batch review unavailable: {import_errors[0]}")
+        print("[ERROR] Install dependencies: pip install aiohttp")
+        return 1
+
+    for number, (batch_files, review) in enumerate(zip(batches, results), 1):
+        if isinstance(review, Exception):
+            print(f"⚠️  Batch review API error: {review}")
+            review = None
 
-        review = reviewer.batch_review(batch_files, args.priority)
         if review:
-            reviewer.save_batch_review(review)
+            reviewer.save_batch_review(review, number if len(batches) > 1 else None)
 
             # Перевіряємо на rejection
-            if 'ВІДХИЛИТИ' in review['review'] or 'REJECT' in review['review']:
-                failed_reviews.extend(batch_files)
-                print(f"[REJECT] Batch {i//batch_size + 1} REJECTED")
+            rejected_files = reviewer.get_rejected_files(review)
+            if rejected_files:
+                failed_reviews.extend(rejected_files)
+                print(f"[REJECT] Batch {number} REJECTED ({len(rejected_files)} of {len(batch_files)} files)")
             else:
-                print(f"[APPROVE] Batch {i//batch_size + 1} APPROVED")
+                print(f"[APPROVE] Batch {number} APPROVED")
         else:
-            print(f"⚠️  Batch {i//batch_size + 1} - Review failed")
+            print(f"⚠️  Batch {number} - Review failed")
 
     if failed_reviews:
         print(f"\n[REJECT] {len(failed_reviews)} files REJECTED by batch review:")
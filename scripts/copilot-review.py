@@ -6,28 +6,141 @@ Optimized for .NET Cloud Engineer workflow
 
 import os
 import sys
+import re
 import json
-import requests
+import hashlib
+import asyncio
+import datetime
 import subprocess
+import tempfile
 from pathlib import Path
 from typing import List, Dict, Optional
 
+try:
+    from orjson import dumps as json_dumps, loads as json_loads
+except ImportError:
+    # orjson is optional, fall back to the slower stdlib json
+    json_loads = json.loads
+
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode('utf-8')
+
+try:
+    import ijson
+except ImportError:
+    # ijson is optional, without it the response body is parsed whole
+    ijson = None
+
+# Results keyed by content hash, shared with smart-filter.py
+CACHE_FILE = Path('.pre-commit-reviews') / 'cache.json'
+CACHE_MAX_ENTRIES = 2048
+
+# Static analysis fallback checks: (keywords, pattern, message, score penalty).
+# A pattern can only match if one of its lowercase keywords occurs in the diff,
+# so the cheap substring test runs first and most diffs never reach the regex.
+STATIC_REVIEW_PATTERNS = tuple(
+    (keywords, re.compile(pattern, re.MULTILINE | re.IGNORECASE), message, penalty)
+    for keywords, pattern, message, penalty in (
+        # Security checks
+        (('hashlib',), r'hashlib\.md5|hashlib\.sha1', 'Weak hashing algorithm detected', 30),
+        (('select', 'insert'), r'SELECT.*\+.*|INSERT.*\+.*', 'Potential SQL injection vulnerability', 40),
+        (('eval', 'exec'), r'eval\s*\(|exec\s*\(', 'Dangerous code execution function', 50),
+        (('open',), r'open\s*\([^)]*[\'"][rwa][\'"]\s*\)', 'File opened without context manager', 10),
+        # Performance checks
+        (('range',), r'for.*in.*range.*\n.*\+\s*=', 'Inefficient string concatenation in loop', 15),
+        (('sleep',), r'time\.sleep\(\s*[0-9]+\s*\)', 'Blocking sleep operation', 10),
+    )
+)
+
+# Review decision that blocks the commit
+REJECT_RE = re.compile(r'REJECT|ВІДХИЛИТИ')
+
+# Pattern made only of `word|word|...` alternatives
+LITERAL_ALTERNATION_RE = re.compile(r'\w+(?:\|\w+)*')
+
+def literal_keywords(patterns: List[str]) -> Optional[frozenset]:
+    """Lowercase words of case-insensitive patterns that are plain word alternations"""
+    if not all(LITERAL_ALTERNATION_RE.fullmatch(p) for p in patterns):
+        return None
+    return frozenset(word.lower() for p in patterns for word in p.split('|'))
+
+async def read_review_text(response) -> str:
+    """Extract first choice message content from a chat completion response"""
+    if ijson is None:
+        result = json_loads(await response.read())
+        return result['choices'][0]['message']['content']
+
+    # Only the content string is materialized, not the whole response tree.
+    # Parsing still runs to the end of the body so the keep-alive
+    # connection goes back to the pool.
+    review_text = None
+    try:
+        async for content in ijson.items(response.content, 'choices.item.message.content'):
+            if review_text is None:
+                review_text = content
+    except ijson.JSONError as e:
+        # ijson errors span several lines, keep the first one
+        message = str(e).partition('\n')[0]
+        raise ValueError(f"Malformed response: {message}") from e
+
+    if review_text is None:
+        raise KeyError('choices')
+    return review_text
+
 class CopilotReviewer:
     def __init__(self):
         self.copilot_url = os.getenv('COPILOT_PROXY_URL', 'http://localhost:8080/v1/chat/completions')
         self.config = self._load_config()
+        # Substring test replaces the critical regexes when they are plain words
+        self._critical_keywords = literal_keywords([p.pattern for p in self.config['critical_patterns']])
+        self.cache = self._load_cache()
+        self._cache_updated = False
+        self.session = None  # aiohttp.ClientSession, created on first request
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self):
+        """Open concurrency gate, HTTP session is created on first request"""
+        self._semaphore = asyncio.Semaphore(self.config.get('max_concurrency', 4))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _get_session(self):
+        """Shared HTTP session, created on first use"""
+        if self.session is None:
+            # Imported lazily: skipped and cached files never need the HTTP stack
+            import aiohttp
+
+            max_concurrency = self.config.get('max_concurrency', 4)
+            # One keep-alive connection per concurrent request, reused for all files
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=max_concurrency),
+                headers={'Content-Type': 'application/json'},
+                timeout=aiohttp.ClientTimeout(total=30)
+            )
+        return self.session
 
     def _load_config(self) -> Dict:
+        """Load configuration and pre-compile review patterns"""
+        config = self._read_config()
+        config['critical_patterns'] = [re.compile(p, re.IGNORECASE) for p in config['critical_patterns']]
+        config['skip_patterns'] = [re.compile(p) for p in config['skip_patterns']]
+        return config
+
+    def _read_config(self) -> Dict:
         """Load configuration from .copilot-config.json"""
         config_file = Path('.copilot-config.json')
         if config_file.exists():
-            with open(config_file) as f:
-                return json.load(f)
+            return json_loads(config_file.read_bytes())
 
         return {
             "model": "gpt-4",
             "temperature": 0.2,
             "max_tokens": 1500,
+            "max_concurrency": 4,
             "critical_patterns": [
                 r"security|auth|encrypt|decrypt|password|token",
                 r"sql|database|query|injection",
@@ -41,52 +154,96 @@ class CopilotReviewer:
             ]
         }
 
+    def _load_cache(self) -> Dict:
+        """Load cached reviews from previous runs"""
+        try:
+            return json_loads(CACHE_FILE.read_bytes())
+        except (OSError, ValueError):
+            return {}
+
+    def _cache_key(self, diff: str) -> str:
+        """Identical diffs reviewed by the same model share a key"""
+        return hashlib.sha256(f"{self.config['model']}\0{diff}".encode('utf-8')).hexdigest()
+
+    def save_cache(self):
+        """Persist cache, keeping only the most recent entries"""
+        if not self._cache_updated:
+            return
+
+        entries = list(self.cache.items())[-CACHE_MAX_ENTRIES:]
+        tmp_name = None
+        try:
+            CACHE_FILE.parent.mkdir(exist_ok=True)
+            # Unique temp file: hooks may run in parallel processes
+            with tempfile.NamedTemporaryFile(dir=CACHE_FILE.parent, prefix='cache.', suffix='.tmp',
+                                             delete=False) as f:
+                tmp_name = f.name
+                f.write(json_dumps(dict(entries)))
+            os.replace(tmp_name, CACHE_FILE)
+        except OSError:
+            # Cache is only an optimization, it must never fail the hook
+            if tmp_name:
+                try:
+                    os.remove(tmp_name)
+                except OSError:
+                    pass
+        self._cache_updated = False
+
     def get_file_diff(self, filepath: str) -> Optional[str]:
         """Get diff for file"""
         try:
             # Get staged diff
             result = subprocess.run([
                 'git', 'diff', '--cached', '--', filepath
-            ], capture_output=True, text=True)
+            ], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
 
-            return result.stdout if result.returncode == 0 else None
+            if result.returncode != 0:
+                return None
+            # Decode explicitly: locale encoding breaks on UTF-8 diffs and binary content
+            return result.stdout.decode('utf-8', errors='replace')
         except Exception as e:
             print(f"Error getting diff for {filepath}: {e}")
             return None
 
     def is_critical_change(self, diff: str, filepath: str) -> bool:
         """Determine if file requires critical review"""
-        import re
-
         # Check critical patterns
-        for pattern in self.config['critical_patterns']:
-            if re.search(pattern, diff, re.IGNORECASE):
+        if self._critical_keywords is not None:
+            diff_lower = diff.lower()
+            if any(keyword in diff_lower for keyword in self._critical_keywords):
                 return True
+        else:
+            for pattern in self.config['critical_patterns']:
+                if pattern.search(diff):
+                    return True
 
-        # Large changes are always critical
-        added_lines = len([line for line in diff.split('\n') if line.startswith('+')])
-        removed_lines = len([line for line in diff.split('\n') if line.startswith('-')])
+        # Large changes are always critical.
+        # Lines starting with +/- are counted in C, without splitting the diff
+        added_lines = diff.count('\n+') + diff.startswith('+')
+        removed_lines = diff.count('\n-') + diff.startswith('-')
 
         return (added_lines + removed_lines) > 20
 
     def should_skip_review(self, diff: str) -> bool:
         """Should skip trivial changes"""
-        import re
-
-        meaningful_lines = [
-            line for line in diff.split('\n')
-            if line.startswith('+') or line.startswith('-')
-        ]
-
-        if len(meaningful_lines) < 3:
-            for pattern in self.config['skip_patterns']:
-                if all(re.match(pattern, line[1:].strip()) for line in meaningful_lines):
-                    return True
+        meaningful_lines = []
+        for line in diff.split('\n'):
+            if line[:1] in ('+', '-'):
+                meaningful_lines.append(line)
+                # Only tiny changes can be skipped, no need to scan further
+                if len(meaningful_lines) >= 3:
+                    return False
+
+        for pattern in self.config['skip_patterns']:
+            if all(pattern.match(line[1:].strip()) for line in meaningful_lines):
+                return True
 
         return False
 
-    def review_file(self, filepath: str) -> Optional[Dict]:
+    async def review_file(self, filepath: str) -> Optional[Dict]:
         """Review individual file"""
+        print(f"[REVIEW] Reviewing {filepath}...")
+
         diff = self.get_file_diff(filepath)
 
         # If no git diff, read file content directly for testing
@@ -103,6 +260,18 @@ class CopilotReviewer:
         if not diff or self.should_skip_review(diff):
             return None
 
+        # Same diff was already reviewed (e.g. after rebase or re-running the hook)
+        cache_key = self._cache_key(diff)
+        cached_review = self.cache.get(cache_key, {}).get('review')
+        if cached_review:
+            print(f"[CACHE] {filepath}: Reusing previous review")
+            return {
+                'file': filepath,
+                'review': cached_review,
+                'critical': self.is_critical_change(diff, filepath),
+                'diff_size': len(diff)
+            }
+
         system_prompt = f"""You are an experienced .NET Cloud Engineer.
 Analyze code changes and provide:
 
@@ -124,37 +293,40 @@ Format: Concise Markdown."""
 Analyze the changes."""
 
         try:
-            response = requests.post(self.copilot_url,
-                json={
-                    "model": self.config["model"],
-                    "temperature": self.config["temperature"],
-                    "max_tokens": self.config["max_tokens"],
-                    "messages": [
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ]
-                },
-                timeout=30
-            )
-
-            if response.status_code == 200:
-                try:
-                    result = response.json()
-                    review_text = result['choices'][0]['message']['content']
-
-                    return {
-                        'file': filepath,
-                        'review': review_text,
-                        'critical': self.is_critical_change(diff, filepath),
-                        'diff_size': len(diff)
-                    }
-                except (KeyError, ValueError) as json_error:
-                    print(f"[WARNING] Copilot API returned invalid JSON for {filepath}: {json_error}")
-                    # Fall back to static analysis
-                    return self._static_review(filepath, diff)
-            else:
-                print(f"[WARNING] Copilot API returned status {response.status_code} for {filepath}")
-                return self._static_review(filepath, diff)
+            # Limit in-flight requests to respect proxy rate limits
+            async with self._semaphore:
+                async with self._get_session().post(self.copilot_url,
+                    data=json_dumps({
+                        "model": self.config["model"],
+                        "temperature": self.config["temperature"],
+                        "max_tokens": self.config["max_tokens"],
+                        "messages": [
+                            {"role": "system", "content": system_prompt},
+                            {"role": "user", "content": user_prompt}
+                        ]
+                    })
+                ) as response:
+                    if response.status != 200:
+                        print(f"[WARNING] Copilot API returned status {response.status} for {filepath}")
+                        return self._static_review(filepath, diff)
+
+                    try:
+                        review_text = await read_review_text(response)
+                    except (KeyError, ValueError) as json_error:
+                        print(f"[WARNING] Copilot API returned invalid JSON for {filepath}: {json_error}")
+                        # Fall back to static analysis
+                        return self._static_review(filepath, diff)
+
+            # Only AI reviews are cached, static fallback is cheap to redo
+            self.cache.setdefault(cache_key, {})['review'] = review_text
+            self._cache_updated = True
+
+            return {
+                'file': filepath,
+                'review': review_text,
+                'critical': self.is_critical_change(diff, filepath),
+                'diff_size': len(diff)
+            }
 
         except Exception as e:
             print(f"[WARNING] Copilot API error for {filepath}: {e}")
@@ -163,29 +335,12 @@ Analyze the changes."""
 
     def _static_review(self, filepath: str, diff: str) -> Dict:
         """Static code analysis fallback when AI API is unavailable"""
-        import re
-
         issues = []
         score = 100
 
-        # Security checks
-        security_patterns = [
-            (r'hashlib\.md5|hashlib\.sha1', 'Weak hashing algorithm detected', 30),
-            (r'SELECT.*\+.*|INSERT.*\+.*', 'Potential SQL injection vulnerability', 40),
-            (r'eval\s*\(|exec\s*\(', 'Dangerous code execution function', 50),
-            (r'open\s*\([^)]*[\'"][rwa][\'"]\s*\)', 'File opened without context manager', 10),
-        ]
-
-        # Performance checks
-        performance_patterns = [
-            (r'for.*in.*range.*\n.*\+\s*=', 'Inefficient string concatenation in loop', 15),
-            (r'time\.sleep\(\s*[0-9]+\s*\)', 'Blocking sleep operation', 10),
-        ]
-
-        all_patterns = security_patterns + performance_patterns
-
-        for pattern, message, penalty in all_patterns:
-            if re.search(pattern, diff, re.MULTILINE | re.IGNORECASE):
+        diff_lower = diff.lower()
+        for keywords, pattern, message, penalty in STATIC_REVIEW_PATTERNS:
+            if any(keyword in diff_lower for keyword in keywords) and pattern.search(diff):
                 issues.append(f"- {message}")
                 score -= penalty
 
@@ -234,37 +389,58 @@ Analyze the changes."""
         reviews_dir = Path('.pre-commit-reviews')
         reviews_dir.mkdir(exist_ok=True)
 
-        import datetime
-        timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+        now = datetime.datetime.now()
+        review_file = reviews_dir / f"review_{now.strftime('%Y%m%d_%H%M%S')}.md"
 
-        review_file = reviews_dir / f"review_{timestamp}.md"
+        # Build the whole report first and write it in one go
+        parts = [
+            "# Pre-commit Code Review\n\n",
+            f"**Timestamp**: {now.isoformat()}\n",
+            f"**Files**: {len(reviews)}\n\n",
+        ]
+        for review in reviews:
+            parts.extend([
+                f"## File: {review['file']}\n\n",
+                f"**Critical**: {'YES' if review['critical'] else 'NO'}\n\n",
+                review['review'],
+                "\n\n---\n\n",
+            ])
+
+        review_file.write_text(''.join(parts), encoding='utf-8')
+
+async def review_files(reviewer: CopilotReviewer, files: List[str]) -> List[Optional[Dict]]:
+    """Review all files concurrently"""
+    async with reviewer:
+        results = await asyncio.gather(
+            *(reviewer.review_file(filepath) for filepath in files),
+            return_exceptions=True
+        )
 
-        with open(review_file, 'w') as f:
-            f.write("# Pre-commit Code Review\n\n")
-            f.write(f"**Timestamp**: {datetime.datetime.now().isoformat()}\n")
-            f.write(f"**Files**: {len(reviews)}\n\n")
+    reviews = []
+    for filepath, result in zip(files, results):
+        if isinstance(result, Exception):
+            print(f"[WARNING] Review failed for {filepath}: {result}")
+            result = None
+        reviews.append(result)
 
-            for review in reviews:
-                f.write(f"## File: {review['file']}\n\n")
-                f.write(f"**Critical**: {'YES' if review['critical'] else 'NO'}\n\n")
-                f.write(review['review'])
-                f.write("\n\n---\n\n")
+    return reviews
 
 def main():
     if len(sys.argv) < 2:
         print("Usage: copilot-review.py <file1> [file2] ...")
         return 0
 
+    files = sys.argv[1:]
     reviewer = CopilotReviewer()
     reviews = []
     failed_reviews = []
 
     print("[AI] Running GitHub Copilot Code Review...")
 
-    for filepath in sys.argv[1:]:
-        print(f"[REVIEW] Reviewing {filepath}...")
+    results = asyncio.run(review_files(reviewer, files))
+    reviewer.save_cache()
 
-        review = reviewer.review_file(filepath)
+    for filepath, review in zip(files, results):
         if review:
             reviews.append(review)
 
@@ -272,7 +448,7 @@ def main():
             print(f"[OK] {filepath}: {'[CRITICAL]' if review['critical'] else '[NORMAL]'}")
 
             # Check for REJECT
-            if 'REJECT' in review['review'] or 'ВІДХИЛИТИ' in review['review']:
+            if REJECT_RE.search(review['review']):
                 failed_reviews.append(review)
         else:
             print(f"[SKIP] {filepath}: Skipped (trivial changes)")
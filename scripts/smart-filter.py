@@ -3,34 +3,102 @@
 Smart Review Filter - determines which files need detailed review
 """
 
+import os
 import sys
+import json
+import mmap
 import subprocess
+import tempfile
 import re
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-
-def get_file_complexity(filepath: str) -> int:
-    """Assess file complexity for review"""
+from typing import Dict, List
+
+try:
+    from orjson import dumps as json_dumps, loads as json_loads
+except ImportError:
+    # orjson is optional, fall back to the slower stdlib json
+    json_loads = json.loads
+
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode('utf-8')
+
+# Results keyed by git blob SHA, shared with copilot-review.py
+CACHE_FILE = Path('.pre-commit-reviews') / 'cache.json'
+CACHE_MAX_ENTRIES = 2048
+
+# Below this many files process startup costs more than it saves
+PARALLEL_MIN_FILES = 16
+
+# Complexity markers with their weights. Separate patterns keep the regex
+# engine's literal prefix search, which is faster than one combined pass.
+# Bytes patterns so they run directly on the memory-mapped file, without decoding.
+COMPLEXITY_PATTERNS = [
+    (re.compile(rb'\b(public|private|protected|internal)\s+\w+.*?\('), 2),  # Number of methods/functions
+    (re.compile(rb'(SELECT|INSERT|UPDATE|DELETE)', re.IGNORECASE), 3),      # SQL queries
+    (re.compile(rb'\b(async|await)\b'), 2),                                 # Async/await patterns
+    (re.compile(rb'\.(Where|Select|FirstOrDefault|Any|All)\('), 1),         # Linq queries
+    (re.compile(rb'\b(try|catch|throw)\b'), 2),                             # Exception handling
+]
+
+def load_cache() -> Dict:
+    """Load cached results from previous runs"""
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            content = f.read()
-
-        # Complexity based on:
-        complexity = 0
+        return json_loads(CACHE_FILE.read_bytes())
+    except (OSError, ValueError):
+        return {}
+
+def save_cache(cache: Dict):
+    """Persist cache, keeping only the most recent entries"""
+    entries = list(cache.items())[-CACHE_MAX_ENTRIES:]
+    tmp_name = None
+    try:
+        CACHE_FILE.parent.mkdir(exist_ok=True)
+        # Unique temp file: hooks may run in parallel processes
+        with tempfile.NamedTemporaryFile(dir=CACHE_FILE.parent, prefix='cache.', suffix='.tmp',
+                                         delete=False) as f:
+            tmp_name = f.name
+            f.write(json_dumps(dict(entries)))
+        os.replace(tmp_name, CACHE_FILE)
+    except OSError:
+        # Cache is only an optimization, it must never fail the hook
+        if tmp_name:
+            try:
+                os.remove(tmp_name)
+            except OSError:
+                pass
+
+def get_blob_shas(files: List[str]) -> Dict[str, str]:
+    """Get git blob SHA of each file content with a single git call"""
+    if not files:
+        return {}
 
-        # Number of methods/functions
-        complexity += len(re.findall(r'\b(public|private|protected|internal)\s+\w+.*?\(', content)) * 2
+    try:
+        result = subprocess.run([
+            'git', 'hash-object', '--'
+        ] + files, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    except Exception:
+        return {}
 
-        # SQL queries
-        complexity += len(re.findall(r'(SELECT|INSERT|UPDATE|DELETE)', content, re.IGNORECASE)) * 3
+    shas = result.stdout.decode('ascii').split()
+    if result.returncode != 0 or len(shas) != len(files):
+        return {}
 
-        # Async/await patterns
-        complexity += len(re.findall(r'\b(async|await)\b', content)) * 2
+    return dict(zip(files, shas))
 
-        # Linq queries
-        complexity += len(re.findall(r'\.(Where|Select|FirstOrDefault|Any|All)\(', content)) * 1
+@lru_cache(maxsize=1024)
+def get_file_complexity(filepath: str) -> int:
+    """Assess file complexity for review"""
+    try:
+        with open(filepath, 'rb') as f:
+            # Empty files cannot be mapped
+            if os.fstat(f.fileno()).st_size == 0:
+                return 0
 
-        # Exception handling
-        complexity += len(re.findall(r'\b(try|catch|throw)\b', content)) * 2
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                complexity = sum(len(pattern.findall(content)) * weight
+                                 for pattern, weight in COMPLEXITY_PATTERNS)
 
         return complexity
 
@@ -41,17 +109,47 @@ def main():
     """Filter files by complexity"""
     threshold = 10  # minimum complexity for review
 
+    files = sys.argv[1:]
     reviewed_files = []
     skipped_files = []
 
-    for filepath in sys.argv[1:]:
-        complexity = get_file_complexity(filepath)
-
+    # Unchanged file content reuses complexity from previous runs
+    shas = get_blob_shas(files)
+    cache = load_cache()
+    cache_updated = False
+
+    complexities = {}
+    for filepath in files:
+        sha = shas.get(filepath)
+        complexity = cache.get(sha, {}).get('complexity') if sha else None
+        if complexity is not None:
+            complexities[filepath] = complexity
+
+    # Regex scanning is CPU-bound, spread uncached files across cores
+    missing = [filepath for filepath in files if filepath not in complexities]
+    if len(missing) >= PARALLEL_MIN_FILES:
+        with ProcessPoolExecutor(max_workers=None) as executor:
+            results = list(executor.map(get_file_complexity, missing, chunksize=8))
+    else:
+        results = [get_file_complexity(filepath) for filepath in missing]
+
+    for filepath, complexity in zip(missing, results):
+        complexities[filepath] = complexity
+        sha = shas.get(filepath)
+        if sha:
+            cache.setdefault(sha, {})['complexity'] = complexity
+            cache_updated = True
+
+    for filepath in files:
+        complexity = complexities[filepath]
         if complexity >= threshold:
             reviewed_files.append((filepath, complexity))
         else:
             skipped_files.append((filepath, complexity))
 
+    if cache_updated:
+        save_cache(cache)
+
     # Only print summary to avoid duplication with main review
     if reviewed_files:
         print(f"[COMPLEXITY] {len(reviewed_files)} files need detailed review")